@@ -3,12 +3,13 @@
 # ---------------------------------------------------------------------------- #
 
 # ---------------------------------------------------------------------------- #
-# Initialize EE API
+# Import EE API (initialized once per session by buildBreakupImage())
 import ee
-ee.Initialize()
+from initEE import initEE
 
 # ---------------------------------------------------------------------------- #
 # Import required packages
+from concurrent.futures import ThreadPoolExecutor
 import prepImage as prepImg
 import prepOpticalBands as prepOpt
 import classifyIce as classIce
@@ -16,43 +17,79 @@ import logisticFilter as logisticFilter
 import sequenceDetection as seqDetect
 
 # ---------------------------------------------------------------------------- #
-# Define breakup detection routine
-def breakupDetection(tile, year, expDirectory, expFilename, cloudThresh = 90, globalWater = True, logFilter = True):
+# Define function factory to prep, mask, and classify a single image
+def makePrepClassFn(prepFn, classFn, aoiMask, maskBeforePrep = False):
     
     """
-    Main OPEN-ICE function, launches a Google Earth Engine task that exports
-    spring breakup image.
+    Returns a function, to map over an image collection, that preps the
+    bands of an image, adds NDSI, masks areas outside of interest, and
+    classifies ice. The maskBeforePrep option is resolved here, once,
+    rather than each time the returned function is called.
+    
+    INPUT
+    prepFn: function from prepOpticalBands that preps sensor bands (e.g., prepL8TOA)
+    classFn: function from classifyIce that classifies sensor images (e.g., classIceL8TOA)
+    aoiMask: ee.Image() mask of areas of interest from prepImage.aoiMask()
+    maskBeforePrep: logical, also mask images before prep (default is False)
+    
+    OUTPUT
+    Function taking an ee.Image() and returning an ee.Image() with the
+    'classIce' band
+    """
+    
+    # Function to mask areas outside of interest
+    def maskAOI(img):
+        return img.updateMask(aoiMask)
+    
+    # Function to prep, mask, and classify
+    if maskBeforePrep:
+        def prepClass(img):
+            img = prepOpt.addNDSI(prepFn(maskAOI(img)))
+            return classFn(maskAOI(img))
+    else:
+        def prepClass(img):
+            img = prepOpt.addNDSI(prepFn(img))
+            return classFn(maskAOI(img))
+    
+    return prepClass
+
+# ---------------------------------------------------------------------------- #
+# Define routine that builds the collection of ice classifications of a tile
+def buildClassCollection(tile, poiStart, poiEnd, cloudThresh = 90, globalWater = True):
+    
+    """
+    Filters L7, L8, and S2 TOA collections for the tile and period of
+    interest, preps bands, and classifies water (0)/ ice (1).
     
     INPUT
     tile: ee.Geometry() of study area
-    year: integer [2013, 2021], year of interest
-    expDirectory: string, directory in which to save asset (e.g., 'myFolder')
-    expFilename: string, name of created asset (e.g., 'myBreakupImg')
-    cloudThresh: integer [0, 100], filter images from L7, L8, and S2 collection based on
-                 cloud cover (default is exclude images with > 90% clouds)
-    globalWater: logical, limit analysis to pixels with >80% persistence in JRC global
-                 water layer (northern limit of 78N)
-    logFilter: logical, apply logistic regression to each pixel and remove potential
-               misclassifications, i.e., residuals > 0.85 (default is True)
-               
+    poiStart, poiEnd: ee.Date() of start and end of period of interest
+    cloudThresh, globalWater: see breakupDetection()
+    
     OUTPUT
-    ee.Image() of spring breakup with following bands at 30 metre resolution
-    - breakupDate: day of year pixel transitioned form ice to water
-    - R2: r-squared of logistic temporal filter
-    - nPixels: number of total ice and water obs between Feb 15th and Sept 30th of 'year'
-    - breakupGap: days elapsed between last observed ice and first observed water
-    - year: year of spring breakup
+    ee.ImageCollection() with 'classIce' band, unsorted
     """
 
     # ---------------------------------------------------------------------------- #
-    # STEP 1: Setup parameters for script
-
-    # Time parameters
-    poiStart = ee.Date.fromYMD(year, 2, 15)
-    poiEnd = ee.Date.fromYMD(year, 10, 1)
-
+    # STEP 2: Define per image band prep, masking, and classification
+    
+    # Mask for current tile, and if globalWater is True, global water mask
+    # using JRC layer 80% occurence, combined once and reused by every image
+    aoiMask = prepImg.aoiMask(tile, globalWater)
+    
+    # Each sensor is prepped, masked, and classified in a single function so
+    # that one map() is applied per collection instead of one map() per step.
+    # Landsat 7 is also masked before prep so that the SLC-off gap fill only
+    # draws on pixels within areas of interest
+    prepClassL7TOA = makePrepClassFn(prepOpt.prepL7TOA, classIce.classIceL7TOA,
+                                     aoiMask, maskBeforePrep = True)
+    prepClassL8TOA = makePrepClassFn(prepOpt.prepL8TOA, classIce.classIceL8TOA,
+                                     aoiMask)
+    prepClassS2TOA = makePrepClassFn(prepOpt.prepS2TOA, classIce.classIceS2TOA,
+                                     aoiMask)
+    
     # ---------------------------------------------------------------------------- #
-    # STEP 2: Filter image collections, apply masks, prep bands
+    # STEP 3: Filter image collections, classify water (0)/ ice (1), merge collections
     
     # LANDSAT 7 TOP OF ATMOSPHERE REFLECTANCE ------------------------------------ #
 
@@ -61,21 +98,8 @@ def breakupDetection(tile, year, expDirectory, expFilename, cloudThresh = 90, gl
                                                          .filterBounds(tile)\
                                                          .filter(ee.Filter.lt('CLOUD_COVER', cloudThresh))
     
-    # Mask for current tile
-    l7toa = prepImg.tileMask(l7toa, tile)
-    
-    # If globalWater is True, apply global water mask using JRC layer 80% occurence
-    if globalWater:
-        l7toa = l7toa.map(prepImg.waterMask)
-    
-    # Prep Landsat 7 TOA bands
-    l7toa = l7toa.map(prepOpt.prepL7TOA)\
-                 .map(prepOpt.addNDSI)
-                 
-    # Repeat masking steps to remove data interpolated outside areas on interest 
-    l7toa = prepImg.tileMask(l7toa, tile)
-    if globalWater:
-        l7toa = l7toa.map(prepImg.waterMask)
+    # Prep, mask, and classify Landsat 7 TOA
+    l7toa = l7toa.map(prepClassL7TOA)
 
     # LANDSAT 8 SURFACE REFLECTANCE ---------------------------------------------- #
 
@@ -84,16 +108,8 @@ def breakupDetection(tile, year, expDirectory, expFilename, cloudThresh = 90, gl
                                                          .filterBounds(tile)\
                                                          .filter(ee.Filter.lt('CLOUD_COVER', cloudThresh))
 
-    # Mask for current tile
-    l8toa = prepImg.tileMask(l8toa, tile)
-    
-    # If globalWater is True, apply global water mask using JRC layer 80% occurence
-    if globalWater:
-        l8toa = l8toa.map(prepImg.waterMask)
-    
-    # Prep Landsat 8 TOA bands
-    l8toa = l8toa.map(prepOpt.prepL8TOA)\
-                 .map(prepOpt.addNDSI)
+    # Prep, mask, and classify Landsat 8 TOA
+    l8toa = l8toa.map(prepClassL8TOA)
 
     # SENTINEL 2 TOP OF ATMOSPHERE REFLECTANCE ----------------------------------- #
 
@@ -102,32 +118,150 @@ def breakupDetection(tile, year, expDirectory, expFilename, cloudThresh = 90, gl
                                                .filterBounds(tile)\
                                                .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', cloudThresh))
     
-    # Mask for current tile
-    s2toa = prepImg.tileMask(s2toa, tile)
-    
-    # If globalWater is True, apply global water mask using JRC layer 80% occurence
-    if globalWater:
-        s2toa = s2toa.map(prepImg.waterMask)
-    
-    # Prep Sentinel 2 TOA 
-    s2toa = s2toa.map(prepOpt.prepS2TOA)\
-                 .map(prepOpt.addNDSI)
-    
     # Remove duplicates (select most recently generated image)
     s2toa = ee.ImageCollection(s2toa.sort('GENERATION_TIME', False)\
                                     .distinct(['system:time_start', 'MGRS_TILE']))
+    
+    # Prep, mask, and classify Sentinel 2 TOA
+    s2toa = s2toa.map(prepClassS2TOA)
+
+    # Merge image collections, left unsorted as sequence detection sorts
+    # chronologically (sensor is given by the 'product' property)
+    imgCol = ee.ImageCollection(l7toa.merge(l8toa).merge(s2toa))
+    
+    return imgCol
+
+# ---------------------------------------------------------------------------- #
+# Define functions to cache a collection of ice classifications as an asset
+
+# Check if an asset exists, errors other than a missing asset (e.g.,
+# permissions, network) are raised
+def assetExists(assetId):
+    try:
+        ee.data.getAsset(assetId)
+        return True
+    except ee.EEException as error:
+        if 'not found' in str(error).lower() or 'does not exist' in str(error).lower():
+            return False
+        raise
+
+# Export task of an asset that is waiting or running (e.g., started by a
+# previous run that has not completed yet), None if there is none. Tasks are
+# matched by description, i.e. the last part of assetId (see exportClassStack())
+def pendingExport(assetId):
+    description = assetId.split('/')[-1]
+    for task in ee.batch.Task.list():
+        if task.state in (ee.batch.Task.State.READY, ee.batch.Task.State.RUNNING)\
+           and task.config.get('description') == description:
+            return task
+    return None
+
+# Parameters with which a collection of ice classifications is built, set as
+# properties of its cached asset (tile is encoded as a GeoJSON string)
+def classStackParams(tile, year, cloudThresh, globalWater):
+    return {
+        'tile': ee.String.encodeJSON(tile),
+        'year': year,
+        'cloudThresh': cloudThresh,
+        'globalWater': int(globalWater)
+    }
+
+# Export task (not started) of a collection of ice classifications as a single
+# image, with one band per image named 'classIce_<index>_<system:time_start>',
+# and the parameters of the classifications as properties
+def exportClassStack(imgCol, assetId, tile, year, cloudThresh, globalWater):
+    # Band names hold time stamps so that the collection can be rebuilt
+    bandNames = imgCol.aggregate_array('system:time_start')\
+                      .map(lambda t: ee.Number(t).toLong().format('%d'))
+    indices = ee.List.sequence(0, bandNames.size().subtract(1))\
+                     .map(lambda i: ee.Number(i).toInt().format('%d'))
+    bandNames = indices.zip(bandNames)\
+                       .map(lambda it: ee.String('classIce_').cat(ee.List(it).join('_')))
+    # Stack images as bands
+    classStack = imgCol.select(['classIce'])\
+                       .toBands()\
+                       .rename(bandNames)\
+                       .set(classStackParams(tile, year, cloudThresh, globalWater))
+    return ee.batch.Export.image.toAsset(
+        image = classStack,
+        description = assetId.split('/')[-1],
+        assetId = assetId,
+        region = tile,
+        pyramidingPolicy = {'.default': 'sample'},
+        maxPixels = 1e13,
+        scale = 30
+    )
+
+# Rebuild collection of ice classifications from an asset of exportClassStack(),
+# raises ValueError if the asset was built with other parameters
+def loadClassStack(assetId, tile, year, cloudThresh, globalWater):
+    # Compare parameters of the asset with those of the call
+    cached = ee.data.getAsset(assetId).get('properties', {})
+    params = classStackParams(tile, year, cloudThresh, globalWater)
+    params['tile'] = params['tile'].getInfo()
+    mismatched = [name for name, value in params.items()
+                  if name not in cached or cached[name] != value]
+    if mismatched:
+        raise ValueError('Cached asset {} was built with other {}, delete it or '
+                         'use another cacheAsset'.format(assetId, ', '.join(mismatched)))
+    # Rebuild collection
+    classStack = ee.Image(assetId)
+    def band2Img(bandName):
+        timeStart = ee.Number.parse(ee.String(bandName).split('_').get(2))
+        return classStack.select([bandName], ['classIce'])\
+                         .set('system:time_start', timeStart)
+    return ee.ImageCollection.fromImages(classStack.bandNames().map(band2Img))
+
+# ---------------------------------------------------------------------------- #
+# Define routine that builds the breakup image of a tile and year
+def buildBreakupImage(tile, year, cloudThresh = 90, globalWater = True, logFilter = True, cacheAsset = None, useArrays = True):
+    
+    """
+    Builds the OPEN-ICE spring breakup image of a tile for a given year,
+    without exporting it. See breakupDetection() for a description of
+    inputs and of the bands of the returned ee.Image().
+    
+    If cacheAsset is provided and does not exist, the export of the ice
+    classifications to cacheAsset is started, unless a task exporting it is
+    already pending (e.g., started by a previous run), in which case the
+    classifications are computed again without starting a second export.
+    
+    Returns a tuple of the breakup ee.Image() and of the started or pending
+    ee.batch.Task exporting cacheAsset (None if no export), or (None, None)
+    if no L7, L8, or S2 image of the tile and year passes the filters.
+    """
 
     # ---------------------------------------------------------------------------- #
-    # STEP 3: Add bands, classify water (0)/ ice (1), merge collections
+    # STEP 1: Setup parameters for script
+
+    # Initialize EE API (no-op if already initialized by OPEN-ICE)
+    initEE()
 
-    # Classify
-    l7toa = l7toa.map(classIce.classIceL7TOA)
-    l8toa = l8toa.map(classIce.classIceL8TOA)
-    s2toa = s2toa.map(classIce.classIceS2TOA)
+    # Time parameters
+    poiStart = ee.Date.fromYMD(year, 2, 15)
+    poiEnd = ee.Date.fromYMD(year, 10, 1)
 
-    # Merge both image collections
-    imgCol = ee.ImageCollection(l7toa.merge(l8toa).merge(s2toa))\
-                .sort('system:time_start', False)
+    # ---------------------------------------------------------------------------- #
+    # STEP 2-3: Filter image collections, prep bands, classify water (0)/ ice (1)
+    
+    # Load classifications cached by a previous run if available, otherwise
+    # classify and, if cacheAsset is provided, launch export of classifications
+    # (or get the pending export of a previous run)
+    cacheTask = None
+    if cacheAsset is not None and assetExists(cacheAsset):
+        imgCol = loadClassStack(cacheAsset, tile, year, cloudThresh, globalWater)
+    else:
+        imgCol = buildClassCollection(tile, poiStart, poiEnd, cloudThresh, globalWater)
+        # Stop early if no L7, L8, or S2 image passed filters (e.g., cloudy
+        # years), nothing to build or export
+        if imgCol.size().getInfo() == 0:
+            return None, None
+        if cacheAsset is not None:
+            cacheTask = pendingExport(cacheAsset)
+            if cacheTask is None:
+                cacheTask = exportClassStack(imgCol, cacheAsset, tile, year,
+                                             cloudThresh, globalWater)
+                cacheTask.start()
     
     # ---------------------------------------------------------------------------- #
     # STEP 4: Temporal filter using logistic regression of ice ~ time
@@ -137,9 +271,6 @@ def breakupDetection(tile, year, expDirectory, expFilename, cloudThresh = 90, gl
     # Apply logistic filter if logFilter == True
     
     if logFilter:
-    
-        # Sort in reverse chrono order
-        imgCol = imgCol.sort('system:time_start', False)
 
         # Add fractional year for input as time variable in logistic regression
         imgCol = imgCol.map(prepImg.addFracYear)
@@ -163,19 +294,10 @@ def breakupDetection(tile, year, expDirectory, expFilename, cloudThresh = 90, gl
         # Sort chronologically
         imgCol = imgCol.sort('system:time_start', True)
 
-        # Count non-masked pixels in stack
-        emptyImg = ee.Image(0).clip(tile).rename('classIce')
-        nPixels = imgCol.select('classIce')\
-                        .merge(emptyImg)\
-                        .reduce(ee.Reducer.count())\
-                        .subtract(1)\
-                        .toUint16()\
-                        .selfMask()\
-                        .rename(['nPixels'])
-
-        # Get R^2 of logistic filter
+        # Get R^2 of logistic filter (same value in all images of a pixel,
+        # so any unmasked image will do)
         rSquared = imgCol.select('R2')\
-                         .reduce(ee.Reducer.firstNonNull())\
+                         .mosaic()\
                          .multiply(100)\
                          .round()\
                          .toUint16()\
@@ -183,26 +305,23 @@ def breakupDetection(tile, year, expDirectory, expFilename, cloudThresh = 90, gl
     
     else:
         
-        # Count non-masked pixels in stack
-        emptyImg = ee.Image(0).clip(tile).rename('classIce')
-        nPixels = imgCol.select('classIce')\
-                        .merge(emptyImg)\
-                        .reduce(ee.Reducer.count())\
-                        .subtract(1)\
-                        .toUint16()\
-                        .selfMask()\
-                        .rename(['nPixels'])
-
         # Create empty image to add as R2 band
         rSquared = ee.Image().clip(tile)\
                              .toUint16()\
                              .rename(['R2'])
 
+    # Count non-masked pixels in stack (never empty, see STEP 2-3)
+    nPixels = imgCol.select('classIce')\
+                    .reduce(ee.Reducer.count())\
+                    .toUint16()\
+                    .selfMask()\
+                    .rename(['nPixels'])
+
     # ---------------------------------------------------------------------------- #
     # STEP 5: Change detection of pixel transition
 
     # New sequence detection functions in module "sequenceDetection.py"
-    iceBreakupImg = seqDetect.detectSpringBreakup(imgCol, poiStart, tile)
+    iceBreakupImg = seqDetect.detectSpringBreakup(imgCol, poiStart, tile, useArrays)
 
     # Compute date of pixel transition (sequence of ice-water-water)
     # average of t_1 and t_2, when:
@@ -227,13 +346,138 @@ def breakupDetection(tile, year, expDirectory, expFilename, cloudThresh = 90, gl
                              .addBands(breakupGap)\
                              .set('year', year)
 
-    # ---------------------------------------------------------------------------- #
-    # STEP 6: Launch export task
-    task = ee.batch.Export.image.toAsset(
-        image = breakupDate, 
+    # Return spring breakup image, and export task of cached classifications
+    return breakupDate, cacheTask
+
+# ---------------------------------------------------------------------------- #
+# Define export task of a breakup image
+def exportBreakupImage(breakupImg, expDirectory, expFilename):
+    
+    """
+    Returns a Google Earth Engine task (not started) that exports a
+    spring breakup image to an asset.
+    
+    INPUT
+    breakupImg: ee.Image() of spring breakup from buildBreakupImage()
+    expDirectory: string, directory in which to save asset (e.g., 'myFolder')
+    expFilename: string, name of created asset (e.g., 'myBreakupImg')
+    """
+    
+    return ee.batch.Export.image.toAsset(
+        image = breakupImg, 
         description = expFilename,
         assetId = expDirectory + '/' + expFilename,
         maxPixels = 1e13,
         scale = 30
     )
-    task.start()
\ No newline at end of file
+
+# ---------------------------------------------------------------------------- #
+# Define breakup detection routine
+def breakupDetection(tile, year, expDirectory, expFilename, cloudThresh = 90, globalWater = True, logFilter = True, cacheAsset = None, useArrays = True):
+    
+    """
+    Main OPEN-ICE function, launches a Google Earth Engine task that exports
+    spring breakup image.
+    
+    INPUT
+    tile: ee.Geometry() of study area
+    year: integer [2013, 2021], year of interest
+    expDirectory: string, directory in which to save asset (e.g., 'myFolder')
+    expFilename: string, name of created asset (e.g., 'myBreakupImg')
+    cloudThresh: integer [0, 100], filter images from L7, L8, and S2 collection based on
+                 cloud cover (default is exclude images with > 90% clouds)
+    globalWater: logical, limit analysis to pixels with >80% persistence in JRC global
+                 water layer (northern limit of 78N)
+    logFilter: logical, apply logistic regression to each pixel and remove potential
+               misclassifications, i.e., residuals > 0.85 (default is True)
+    cacheAsset: string, asset id (e.g., 'myFolder/myClassStack') of the ice classifications
+                of 'tile' and 'year', loaded if it exists, otherwise a task exporting the
+                classifications to it is launched for use by later runs (default is None,
+                no caching). Raises ValueError if the asset was built with another
+                'tile', 'year', 'cloudThresh', or 'globalWater'. Runs made while the
+                export is pending do not start it again, but compute the classifications
+                again (wait for the export task to complete to benefit from the cache)
+    useArrays: logical, detect ice-water-water sequences on arrays of each pixel's time
+               series in a single step (default is True), set to False to iterate through
+               the time series one image at a time instead, slower but uses less memory
+               for tiles with very long or dense time series (e.g., if the export fails
+               with a memory limit error)
+               
+    OUTPUT
+    Tuple of the started ee.batch.Task exporting an ee.Image() of spring breakup,
+    and of the started or pending ee.batch.Task exporting 'cacheAsset' (None if
+    no export). (None, None), and no task launched, if no L7, L8, or S2 image of
+    'tile' and 'year' passes the filters. The spring breakup image has the
+    following bands at 30 metre resolution:
+    - breakupDate: day of year pixel transitioned form ice to water
+    - R2: r-squared of logistic temporal filter
+    - nPixels: number of total ice and water obs between Feb 15th and Sept 30th of 'year'
+    - breakupGap: days elapsed between last observed ice and first observed water
+    - year: year of spring breakup
+    """
+
+    # Build spring breakup image
+    breakupImg, cacheTask = buildBreakupImage(tile, year, cloudThresh, globalWater,
+                                              logFilter, cacheAsset, useArrays)
+    if breakupImg is None:
+        return None, None
+
+    # Launch export task
+    task = exportBreakupImage(breakupImg, expDirectory, expFilename)
+    task.start()
+    
+    return task, cacheTask
+
+# ---------------------------------------------------------------------------- #
+# Define batch breakup detection routine
+def breakupDetectionBatch(tiles, years, expDirectory, expPrefix, cloudThresh = 90, globalWater = True, logFilter = True, useArrays = True, maxWorkers = 16):
+    
+    """
+    Launches one OPEN-ICE export task per tile and year. Tiles and years are
+    processed concurrently, as checking for available images and starting a
+    task are bound by network latency.
+    
+    INPUT
+    tiles: dictionary of {tileName: ee.Geometry()} of study areas
+    years: list of integers [2013, 2021], years of interest
+    expDirectory: string, directory in which to save assets (e.g., 'myFolder')
+    expPrefix: string, prefix of created assets, named expPrefix_tileName_year
+    cloudThresh, globalWater, logFilter, useArrays: see breakupDetection()
+    maxWorkers: integer, maximum number of tiles and years processed simultaneously
+                (default is 16)
+    
+    OUTPUT
+    tuple of
+    - list of started ee.batch.Task (tiles and years without images are skipped)
+    - list of (tileName, year, exception) of tiles and years that failed (e.g., quota
+      or network errors), the other tiles and years are still processed
+    """
+    
+    # Initialize EE API before starting threads
+    initEE()
+    
+    # Function to build and export a single tile and year
+    def launchTask(tileName, tile, year):
+        expFilename = '{}_{}_{}'.format(expPrefix, tileName, year)
+        return breakupDetection(tile, year, expDirectory, expFilename,
+                                cloudThresh, globalWater, logFilter,
+                                useArrays = useArrays)
+    
+    # Launch tasks concurrently
+    with ThreadPoolExecutor(max_workers = maxWorkers) as executor:
+        futures = {(tileName, year): executor.submit(launchTask, tileName, tile, year)
+                   for tileName, tile in tiles.items() for year in years}
+    
+    # Collect started tasks, and tiles and years that failed
+    tasks = []
+    failed = []
+    for (tileName, year), future in futures.items():
+        try:
+            task, _ = future.result()
+        except Exception as error:
+            failed.append((tileName, year, error))
+            continue
+        if task is not None:
+            tasks.append(task)
+    
+    return tasks, failed
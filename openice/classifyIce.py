@@ -1,148 +1,112 @@
 # ---------------------------------------------------------------------------- #
-# Load/initialize Earth Engine API
+# Load Earth Engine API
+import math
+from dataclasses import dataclass
 import ee
-ee.Initialize()
 
 # ---------------------------------------------------------------------------- #
-# ---------------------------------------------------------------------------- #
-# LANDSAT 7 TOP OF ATMOSPHERE CLASSIFICATION
-
-# ---------------------------------------------------------------------------- #
-# Define classifier parameters for L7 TOA
-
-# Bands required for classification
-classBandsL7TOA = ['blue', 'swir2']
-
-# Define Landsat 7 TOA classification tree
-treeStringL7TOA = "\n".join([  
-"1) root 927984 618656 0 (0.333333333 0.333333333 0.333333333)  ",
-"  2) swir2< 0.08979684 615416 307150 0 (0.500906704 0.490882590 0.008210706)  ",
-"    4) blue< 0.1603449 313364  11715 0 (0.962615361 0.036312403 0.001072235) *",
-"    5) blue>=0.1603449 302052  11334 1 (0.021906824 0.962476660 0.015616516) *",
-"  3) swir2>=0.08979684 312568   8293 9 (0.003397661 0.023134166 0.973468173) *",
-])
-
-# Define L7 TOA decision tree classifier
-classL7TOA = ee.Classifier.decisionTree(treeStringL7TOA)
-
-# ---------------------------------------------------------------------------- #
-# Define classification function for L7 TOA
-def classIceL7TOA(img):
+# Sensor specific classifier parameters
+@dataclass(frozen=True)
+class SensorSpec:
     """
-    This function classifies Landsat 7 TOA images into ice, water, and clouds.
-    
-    INPUT: Landsat 7 TOA image with 'blue' and 'swir2' standard band names
-           required for ice-water-cloud classification
-    OUTPUT: Returns image with band of ice presence (1) or absence (0),
-            and no data where classifier detected clouds
+    Parameters of an ice-water-cloud classifier for a given sensor.
+
+    bands: tuple of standard band names required for classification
+    expression: ee.Image.expression() string of the sensor's decision tree,
+                evaluates to classes water (0), ice (1), and clouds (9)
     """
-    
-    # Classify into ice-water-clouds
-    classified =  img.select(classBandsL7TOA)\
-                     .classify(classL7TOA)
-    # Create cloud mask with buffer
-    cloud = classified.eq(9)
-    cloudMask = cloud.fastDistanceTransform().gt(30)
-    # Create band for ice, mask clouds detected by classifier
-    ice = classified.eq(1).toUint16()\
-                    .updateMask(cloudMask)\
-                    .rename(['classIce']) 
-    # Return ice, save properties
-    return img.addBands(ice)\
-              .select(['classIce'])
+    bands: tuple
+    expression: str
 
 # ---------------------------------------------------------------------------- #
 # ---------------------------------------------------------------------------- #
-# LANDSAT 8 TOP OF ATMOSPHERE REFLECTANCE CLASSIFICATION
-
-# ---------------------------------------------------------------------------- #
-# Define classifier parameters for L8 TOA
-
-# Bands required for classification
-classBandsL8TOA = ['blue', 'ndsi']
-
-# Define Landsat 8 TOA classification tree
-treeStringL8TOA = "\n".join([ 
-"1) root 1174044 782696 0 (3.333333e-01 3.333333e-01 3.333333e-01)  ",
-"  2) blue< 0.1432013 393101   1826 0 (9.953549e-01 4.550993e-03 9.412339e-05) *",
-"  3) blue>=0.1432013 780943 389632 9 (9.347673e-05 4.988315e-01 5.010750e-01)  ",
-"    6) ndsi>=0.8493385 388665    327 1 (5.917693e-05 9.991587e-01 7.821646e-04) *",
-"    7) ndsi< 0.8493385 392278   1271 9 (1.274606e-04 3.112589e-03 9.967600e-01) *",
-])
+# LANDSAT 7 TOP OF ATMOSPHERE CLASSIFICATION
 
-# Define L8 TOA decision tree classifier
-classL8TOA = ee.Classifier.decisionTree(treeStringL8TOA)
+# Landsat 7 TOA classification tree (rpart format), requires 'blue' and 'swir2'
+#   1) root 927984 618656 0 (0.333333333 0.333333333 0.333333333)
+#     2) swir2< 0.08979684 615416 307150 0 (0.500906704 0.490882590 0.008210706)
+#       4) blue< 0.1603449 313364  11715 0 (0.962615361 0.036312403 0.001072235) *
+#       5) blue>=0.1603449 302052  11334 1 (0.021906824 0.962476660 0.015616516) *
+#     3) swir2>=0.08979684 312568   8293 9 (0.003397661 0.023134166 0.973468173) *
+# Define Landsat 7 TOA classifier as an expression of the tree above
+specL7TOA = SensorSpec(
+    bands = ('blue', 'swir2'),
+    expression = "(swir2 >= 0.08979684) ? 9 : ((blue < 0.1603449) ? 0 : 1)"
+)
 
 # ---------------------------------------------------------------------------- #
-# Define classification function for L8 TOA
-def classIceL8TOA(img):
-    """
-    This function classifies Landsat 8 TOA images into ice, water, and clouds.
-    
-    INPUT: Landsat 8 TOA image with 'blue' and 'ndsi' standard band names
-           required for ice-water-cloud classification
-    OUTPUT: Returns image with band of ice presence (1) or absence (0),
-            and no data where classifier detected clouds
-    """
-    
-    # Classify into ice-water-clouds
-    classified =  img.select(classBandsL8TOA)\
-                     .classify(classL8TOA)
-    # Create cloud mask with buffer
-    cloud = classified.eq(9)
-    cloudMask = cloud.fastDistanceTransform().gt(30)
-    # Create band for ice, mask clouds detected by classifier
-    ice = classified.eq(1).toUint16()\
-                    .updateMask(cloudMask)\
-                    .rename(['classIce']) 
-    # Return ice, save properties
-    return img.addBands(ice)\
-              .select(['classIce'])
+# ---------------------------------------------------------------------------- #
+# LANDSAT 8 TOP OF ATMOSPHERE REFLECTANCE CLASSIFICATION
+
+# Landsat 8 TOA classification tree (rpart format), requires 'blue' and 'ndsi'
+#   1) root 1174044 782696 0 (3.333333e-01 3.333333e-01 3.333333e-01)
+#     2) blue< 0.1432013 393101   1826 0 (9.953549e-01 4.550993e-03 9.412339e-05) *
+#     3) blue>=0.1432013 780943 389632 9 (9.347673e-05 4.988315e-01 5.010750e-01)
+#       6) ndsi>=0.8493385 388665    327 1 (5.917693e-05 9.991587e-01 7.821646e-04) *
+#       7) ndsi< 0.8493385 392278   1271 9 (1.274606e-04 3.112589e-03 9.967600e-01) *
+# Define Landsat 8 TOA classifier as an expression of the tree above
+specL8TOA = SensorSpec(
+    bands = ('blue', 'ndsi'),
+    expression = "(blue < 0.1432013) ? 0 : ((ndsi >= 0.8493385) ? 1 : 9)"
+)
 
 # ---------------------------------------------------------------------------- #
 # ---------------------------------------------------------------------------- #
 # SENTINEL 2 TOP OF ATMOSPHERE REFLECTANCE
 
+# Sentinel 2 TOA classification tree (rpart format), requires 'blue' and 'ndsi'
+#   1) root 902238 601492 0 (3.333333e-01 3.333333e-01 3.333333e-01)
+#     2) blue< 0.1414 307714   7105 0 (9.769104e-01 2.300513e-02 8.449404e-05) *
+#     3) blue>=0.1414 594524 293804 9 (2.304365e-04 4.939531e-01 5.058164e-01)
+#       6) ndsi>=0.8172837 299419   7080 1 (6.679603e-05 9.763542e-01 2.357900e-02) *
+#       7) ndsi< 0.8172837 295105   1445 9 (3.964691e-04 4.500093e-03 9.951034e-01) *
+# Define Sentinel 2 TOA classifier as an expression of the tree above
+specS2TOA = SensorSpec(
+    bands = ('blue', 'ndsi'),
+    expression = "(blue < 0.1414) ? 0 : ((ndsi >= 0.8172837) ? 1 : 9)"
+)
+
 # ---------------------------------------------------------------------------- #
-# Define classifier parameters for S2 TOA
+# Radius (pixels) of cloud buffer, pixels with squared distance to the nearest
+# cloud > 30 are kept
+cloudBufferRadius = math.sqrt(30)
 
-# Bands required for classification
-classBandsS2TOA = ['blue', 'ndsi']
+# ---------------------------------------------------------------------------- #
+# Define classification function factory
+def makeClassIce(spec):
+    """
+    This function returns a classification function for the sensor described
+    by spec, which classifies images into ice, water, and clouds.
 
-# Define Sentinel 2 TOA classification tree
-treeStringS2TOA = "\n".join([  
-"1) root 902238 601492 0 (3.333333e-01 3.333333e-01 3.333333e-01)  ",
-"  2) blue< 0.1414 307714   7105 0 (9.769104e-01 2.300513e-02 8.449404e-05) *",
-"  3) blue>=0.1414 594524 293804 9 (2.304365e-04 4.939531e-01 5.058164e-01)  ",
-"    6) ndsi>=0.8172837 299419   7080 1 (6.679603e-05 9.763542e-01 2.357900e-02) *",
-"    7) ndsi< 0.8172837 295105   1445 9 (3.964691e-04 4.500093e-03 9.951034e-01) *",
-])
+    INPUT: SensorSpec of the sensor
+    OUTPUT: Function that takes an image with the standard band names in
+            spec.bands, and returns an image with band of ice presence (1)
+            or absence (0), and no data where classifier detected clouds
+    """
 
-# Define S2 TOA decision tree classifier
-classS2TOA = ee.Classifier.decisionTree(treeStringS2TOA)
+    def classIce(img):
+        # Classify into ice-water-clouds
+        classified = img.expression(spec.expression,
+                                    {band: img.select(band) for band in spec.bands})
+        # Create cloud mask with buffer: mask pixels closer than sqrt(30)
+        # pixels to a cloud (i.e., squared distance to clouds <= 30)
+        cloudMask = classified.eq(9)\
+                              .focal_max(radius = cloudBufferRadius,
+                                         kernelType = 'circle',
+                                         units = 'pixels')\
+                              .Not()
+        # Create band for ice, mask clouds detected by classifier
+        ice = classified.eq(1).toUint8()\
+                        .updateMask(cloudMask)\
+                        .rename(['classIce'])
+        # Return ice, save properties (ordinary ones and time stamp)
+        return ee.Image(ice.copyProperties(img)\
+                           .copyProperties(img, ['system:time_start']))
+
+    return classIce
 
 # ---------------------------------------------------------------------------- #
-# Define classification function for S2 TOA
-def classIceS2TOA(img):
-    """
-    This function classifies Sentinel 2 TOA images into ice, water, and clouds.
-    
-    INPUT: Sentinel 2 TOA image with 'blue' and 'ndsi' standard band names
-           required for ice-water-cloud classification
-    OUTPUT: Returns image with band of ice presence (1) or absence (0),
-            and no data where classifier detected clouds
-    """
-    
-    # Classify into ice-water-clouds
-    classified = img.select(classBandsS2TOA)\
-                    .classify(classS2TOA)
-    # Create cloud mask with buffer
-    cloud = classified.eq(9)
-    cloudMask = cloud.fastDistanceTransform().gt(30)
-    # Create band for ice, mask out clouds detected by classifiers
-    ice = classified.eq(1).toUint16()\
-                    .updateMask(cloudMask)\
-                    .rename(['classIce']) 
-    # Return ice, save properties
-    return img.addBands(ice)\
-              .select(['classIce'])
\ No newline at end of file
+# Define classification functions for L7 TOA, L8 TOA, and S2 TOA
+classIceL7TOA = makeClassIce(specL7TOA)
+classIceL8TOA = makeClassIce(specL8TOA)
+classIceS2TOA = makeClassIce(specS2TOA)
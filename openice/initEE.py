@@ -0,0 +1,21 @@
+# ---------------------------------------------------------------------------- #
+# ---------------------------------------------------------------------------- #
+# Shared initialization of the Earth Engine API, so that OPEN-ICE modules
+# authenticate once per Python session rather than once per module
+
+# ---------------------------------------------------------------------------- #
+# Import required packages
+import functools
+import ee
+
+# ---------------------------------------------------------------------------- #
+# Initialize EE API once
+@functools.lru_cache(maxsize=1)
+def initEE():
+    """
+    This function initializes the Earth Engine API on its first call and
+    returns the ee module. Subsequent calls return the cached module without
+    initializing the API again.
+    """
+    ee.Initialize()
+    return ee
@@ -5,9 +5,89 @@
 # with high residuals (likely misclassifications)
 
 # ---------------------------------------------------------------------------- #
-# Initialize EE API
+# Import EE API (initialized by caller, see initEE.py)
 import ee
-ee.Initialize()
+
+# ---------------------------------------------------------------------------- #
+# Import required packages
+import functools
+
+# ---------------------------------------------------------------------------- #
+# Inverse logit function
+def invLogit(z):
+    """
+    This function returns the inverse logit exp(z) / (1 + exp(z)) of an image,
+    with exp(z) computed only once.
+    """
+    expz = z.exp()
+    return expz.divide(expz.add(1))
+
+# ---------------------------------------------------------------------------- #
+# Functions mapped over image collections by fitLogisticRegression(), defined
+# once at module level, their parameters are bound with functools.partial
+
+# Function to prepare inputs for logistic regression
+def prepLogisticInputs(y, one, img):
+    # transform to avoid infinity (0 -> 0.001, 1 -> 0.999)
+    yt = img.select(y)\
+            .multiply(0.998)\
+            .add(0.001)
+    # calculate logit of dependant variable ln(y/(1-y))
+    logity = yt.divide(one.subtract(yt))\
+               .log()\
+               .rename(['logity'])
+    # add constant of 1 to estimate β0
+    constant = one.rename(['constant'])
+    # add bands to each image
+    return img.addBands(logity)\
+              .addBands(constant, ['constant'], True)
+
+# Function that adds β coefficients, fitted values, and residuals to an img
+def addFittedResiduals(y, x, b0, b1, img):
+    # β0 + β1*x
+    z = b0.add(b1.multiply(img.select([x])))
+    # ICEt = exp(β0 + β1*x) / (1 + exp(β0 + β1*x))
+    fitted = invLogit(z).rename(['fitted'])
+    # mask values fitted to masked pixels
+    mask = img.select(y).lte(1)
+    fitted = fitted.updateMask(mask)
+    # calculate residuals (observed - fitted)
+    residuals = fitted.subtract(img.select(y))\
+                      .rename(['residuals'])
+    # return β coefficients, fitted values with same mask as y, residuals
+    return img.addBands([b0, b1, fitted, residuals])
+
+# Squared deviations of an img, summed over the collection in addRsquared()
+# Sum of Squares Regression (SSR) = ∑n_i (yhat_i−yflat)^2
+# Total sum of squares (SSTO) = ∑n_i(y_i−yflat)^2
+def squaredDeviations(y, yflat, img):
+    # squares as products, cheaper than pow(2)
+    yhat_yflat = img.select('fitted')\
+                    .subtract(yflat)
+    yhat_yflat = yhat_yflat.multiply(yhat_yflat)
+    yi_yflat = img.select(y)\
+                  .subtract(yflat)
+    yi_yflat = yi_yflat.multiply(yi_yflat)
+    return yhat_yflat.addBands(yi_yflat)\
+                     .rename(['SSR', 'SSTO'])
+
+# Function to add R2 to an img
+def addCalcR2(R2, img):
+    return img.addBands(R2)
+
+# Function to calculate R-squared
+def addRsquared(imgColLogReg, y):
+    # calculate yflat
+    yflat = imgColLogReg.select(y).mean()
+    # Sum squared deviations in a single pass
+    sumSquares = imgColLogReg.map(functools.partial(squaredDeviations, y, yflat))\
+                             .sum()
+    # Calculate R2
+    R2 = sumSquares.select('SSR')\
+                   .divide(sumSquares.select('SSTO'))\
+                   .rename(['R2'])
+    # Add R2
+    return imgColLogReg.map(functools.partial(addCalcR2, R2))
 
 # ---------------------------------------------------------------------------- #
 # Function to fit logistic regression
@@ -31,23 +111,12 @@ def fitLogisticRegression(imgCol, y, x):
     Bands added to images in imgCol: B0, B1, fitted, residuals, R2
     """
     
-    # Function to prepare inputs for logistic regression
-    def prepLogisticInputs(img):
-        # transform to avoid infinity
-        yt = img.select(y)\
-                .remap([0,1], [0.001,0.999])
-        # calculate logit of dependant variable ln(y/(1-y))
-        logity = yt.divide(ee.Image(1.0).subtract(yt))\
-                   .log()\
-                   .rename(['logity'])
-        # add constant of 1 to estimate β0
-        constant = ee.Image.constant(1)
-        # add bands to each image
-        return img.addBands(logity)\
-                  .addBands(constant, ['constant'], True)
+    # Constant image of 1, shared by every img in imgCol in prepLogisticInputs()
+    # (logit denominator and constant band)
+    one = ee.Image(1.0)
     
     # Apply function to each img in imgCol
-    logisticInputs = imgCol.map(prepLogisticInputs)
+    logisticInputs = imgCol.map(functools.partial(prepLogisticInputs, y, one))
     
     # Fit logistic regression
     logisticRegression = logisticInputs.select(['constant', x, 'logity'])\
@@ -59,68 +128,15 @@ def fitLogisticRegression(imgCol, y, x):
                                      .arrayFlatten([['constant', x]])\
                                      .rename(['B0', 'B1'])
     
-    # Define function that adds β coefficients to imgCol
-    def addBetaCoefficients(img):
-        return img.addBands(coefficients.select('B0'))\
-                  .addBands(coefficients.select('B1'))
-    
-    # Define function to calculate fitted values based on coefficients
-    def addFitted(img):
-        # exp(β0 + β1*x)
-        top = img.select('B0')\
-                 .add(img.select('B1').multiply(img.select([x])))\
-                 .exp()
-        # (1 + exp(β0 + β1*x))
-        bottom = ee.Image(1.0).add(top)
-        # ICEt = exp(β0 + β1*x) / (1 + exp(β0 + β1*x))
-        fitted = top.divide(bottom).rename(['fitted'])
-        # mask values fitted to masked pixels
-        mask = img.select(y).lte(1)
-        fitted = fitted.updateMask(mask)
-        # return fitted values with same mask as y
-        return img.addBands(fitted)
-    
-    # Define function to add residuals 
-    def addResiduals(img):
-        # calculate residuals (observed - fitted)
-        residuals = img.select('fitted')\
-                       .subtract(img.select(y))\
-                       .rename(['residuals'])
-        return img.addBands(residuals)
+    # Split β coefficients once, shared by every img in imgCol
+    b0 = coefficients.select('B0')
+    b1 = coefficients.select('B1')
     
     # Fit model and add coefficents, fitted values, and residuals
-    outputImgCol = imgCol.map(addBetaCoefficients)\
-                         .map(addFitted)\
-                         .map(addResiduals)
-    
-    # Define function to calculate R-squared
-    def addRsquared(imgColLogReg):
-        # calculate yflat
-        yflat = imgColLogReg.select(y).mean()
-        # Sum of Squares Regression (SSR) = ∑n_i (yhat_i−yflat)^2
-        def yhat_yflat(img):
-            return img.select('fitted')\
-                      .subtract(yflat)\
-                      .pow(2)
-        SSR = imgColLogReg.map(yhat_yflat)\
-                          .sum()
-        # Total sum of squares (SSTO) = ∑n_i(y_i−yflat)^2
-        def yi_yflat(img):
-            return img.select(y)\
-                      .subtract(yflat)\
-                      .pow(2)
-        SSTO = imgColLogReg.map(yi_yflat)\
-                           .sum()
-        # Calculate, add R2
-        def addCalcR2(img):
-            # Calculate R2
-            R2 = SSR.divide(SSTO).rename(['R2'])
-            return img.addBands(R2)
-            
-        return imgColLogReg.map(addCalcR2)
+    outputImgCol = imgCol.map(functools.partial(addFittedResiduals, y, x, b0, b1))
     
     # Add r-squared
-    outputImgCol = addRsquared(outputImgCol)
+    outputImgCol = addRsquared(outputImgCol, y)
     
     # Return collection with added B0, B1, fitted, residuals, R2
     return outputImgCol
@@ -6,21 +6,74 @@
 # ---------------------------------------------------------------------------- #
 
 # ---------------------------------------------------------------------------- #
-# Initialize EE API
+# Import EE API, initialized once per session when the layers below are built
+import sys
 import ee
-ee.Initialize()
+from initEE import initEE
 
 # ---------------------------------------------------------------------------- #
 # Global water masking function
 
-# Import global water JRC layer
-globalWater = ee.Image('JRC/GSW1_4/GlobalSurfaceWater')\
-                          .select('occurrence').gte(80)
+# Asset id of the North America coastline raster exported once with
+# exportNorthAmCoastline(), if None the boundary polygons are rasterized on
+# the fly. Set before first use of the layers below, e.g.:
+# prepImage.northAmCoastlineAsset = 'users/<username>/northAmCoastline'
+northAmCoastlineAsset = None
 
-# Import Large Scale International Boundary Polygons for NA, convert to raster
-filterNorthAm = ee.Filter.inList('country_co', ['CA', 'US'])
-northAm = ee.FeatureCollection("USDOS/LSIB_SIMPLE/2017").filter(filterNorthAm)
-northAmCoastline = ee.Image(0).byte().paint(northAm, 1)
+# Rasterize the North America boundary polygons (1 inside, 0 outside)
+def paintNorthAmCoastline():
+    return ee.Image(0).byte().paint(thisModule.northAm, 1)
+
+# EE constants of this module (waterMask() layers, epoch of addFracYear() and
+# addAllDateBands()), built on first access through the module __getattr__
+# below (PEP 562) so that importing this module is free
+lazyLayers = {
+    # Import global water JRC layer
+    'globalWater': lambda: ee.Image('JRC/GSW1_4/GlobalSurfaceWater')\
+                                    .select('occurrence').gte(80),
+    # Import Large Scale International Boundary Polygons for NA, convert to raster
+    'filterNorthAm': lambda: ee.Filter.inList('country_co', ['CA', 'US']),
+    'northAm': lambda: ee.FeatureCollection("USDOS/LSIB_SIMPLE/2017")\
+                         .filter(thisModule.filterNorthAm),
+    'northAmCoastline': lambda: ee.Image(northAmCoastlineAsset)\
+                                if northAmCoastlineAsset is not None\
+                                else paintNorthAmCoastline(),
+    # Freshwater mask: global water without marine coastal areas
+    'freshwaterMask': lambda: thisModule.globalWater.updateMask(thisModule.northAmCoastline),
+    # Epoch of fractional years, used by addFracYear() and addAllDateBands()
+    'epoch': lambda: ee.Date('1970-01-01'),
+}
+
+def __getattr__(name):
+    if name not in lazyLayers:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    initEE()
+    # Store layer as module global, subsequent accesses skip __getattr__
+    layer = globals()[name] = lazyLayers[name]()
+    return layer
+
+# Module object, attribute access builds layers through __getattr__
+thisModule = sys.modules[__name__]
+
+# Export North America coastline raster
+def exportNorthAmCoastline(assetId):
+    """
+    This function returns the export task (not started) of the North America
+    coastline raster used by waterMask() to an asset, at the resolution of the
+    JRC global surface water layer (30 m). Once exported, point
+    northAmCoastlineAsset to assetId so that the boundary polygons no longer
+    need to be rasterized for each request.
+    """
+    initEE()
+    return ee.batch.Export.image.toAsset(
+        image = paintNorthAmCoastline(),
+        description = assetId.split('/')[-1],
+        assetId = assetId,
+        region = thisModule.northAm.geometry().bounds(),
+        pyramidingPolicy = {'.default': 'mode'},
+        maxPixels = 1e13,
+        scale = 30
+    )
 
 # Water mask function
 def waterMask(img):
@@ -30,7 +83,29 @@ def waterMask(img):
     and removes water pixels in marine coastal areas (using political boundary coastlines) 
     see manual: https://storage.googleapis.com/global-surface-water/downloads_ancillary/DataUsersGuidev2021.pdf
     """
-    return img.updateMask(globalWater.updateMask(northAmCoastline))
+    return img.updateMask(thisModule.freshwaterMask)
+
+# ---------------------------------------------------------------------------- #
+# Tile raster function
+def tileRaster(tile):
+    """
+    This function rasterizes the provided tile (geometry) into a mask image,
+    with a value of 1 inside the tile and 0 outside.
+    """
+    return ee.Image(0).byte().paint(tile, 1)
+
+# ---------------------------------------------------------------------------- #
+# Area of interest mask function
+def aoiMask(tile, globalWater = True):
+    """
+    This function combines the tile mask and, if globalWater is True, the
+    freshwater mask of waterMask() into a single mask image, so that both
+    can be applied to an image with one updateMask().
+    """
+    mask = tileRaster(tile)
+    if globalWater:
+        mask = mask.And(thisModule.freshwaterMask)
+    return mask
 
 # ---------------------------------------------------------------------------- #
 # Tile mask function
@@ -40,7 +115,7 @@ def tileMask(imgCol, tile):
     for each img in an imgCol.
     """
     # Create mask of tile
-    mask = ee.Image(0).byte().paint(tile, 1)
+    mask = tileRaster(tile)
     # Function to map over collection
     def mapTileMask(img):
         # update image mask
@@ -55,8 +130,9 @@ def addDate(img):
     This function adds both the year and the day of year (doy) as bands to an image.
     """
     # Get the day of year and year, convert to unsigned 16 bit integer
-    doy = img.date().getRelative('day', 'year').add(1).toUint16()
-    year = img.date().get('year').toUint16()
+    date = img.date()
+    doy = date.getRelative('day', 'year').add(1).toUint16()
+    year = date.get('year').toUint16()
     # Create single banded image for each
     doyBand = ee.Image(doy).rename(['doy'])
     yearBand = ee.Image(year).rename(['year'])
@@ -97,7 +173,7 @@ def addFracYear(img):
     and adds it as a band to an image.
     """
     # Fractional years since the epoch
-    fracYear = img.date().difference(ee.Date('1970-01-01'), 'year').add(1970)
+    fracYear = img.date().difference(thisModule.epoch, 'year').add(1970)
     # Create single band image, rename
     fracYearBand = ee.Image(fracYear).float().rename(['fracYear'])
     # Add band
@@ -112,4 +188,28 @@ def addDateProp(img):
     # Extract date from 'system:time_start'
     date = img.date().format('YYYY-MM-dd')
     # Add property
-    return img.set('date', date)
\ No newline at end of file
+    return img.set('date', date)
+
+# ---------------------------------------------------------------------------- #
+# Add all dates (day of year, year, fractional year) as bands, date as property
+def addAllDateBands(img):
+    """
+    This function adds the day of year (doy), year, and fractional year
+    (fracYear) as bands, and the date (format YYYY-MM-dd) as a property to an
+    image. Equivalent to applying addDate(), addFracYear(), and addDateProp()
+    in a single map(), with the image date computed only once.
+    """
+    # Extract date from 'system:time_start'
+    date = img.date()
+    # Get the day of year and year, convert to unsigned 16 bit integer
+    doy = date.getRelative('day', 'year').add(1).toUint16()
+    year = date.get('year').toUint16()
+    # Fractional years since the epoch
+    fracYear = date.difference(thisModule.epoch, 'year').add(1970)
+    # Create single banded image for each
+    doyBand = ee.Image(doy).rename(['doy'])
+    yearBand = ee.Image(year).rename(['year'])
+    fracYearBand = ee.Image(fracYear).float().rename(['fracYear'])
+    # Add bands and property to image
+    return img.addBands([doyBand, yearBand, fracYearBand])\
+              .set('date', date.format('YYYY-MM-dd'))
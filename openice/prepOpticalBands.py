@@ -7,9 +7,8 @@
 # ---------------------------------------------------------------------------- #
 
 # ---------------------------------------------------------------------------- #
-# Initialize EE API
+# Import EE API (initialized by caller, see initEE.py)
 import ee
-ee.Initialize()
 
 # ---------------------------------------------------------------------------- #
 # Setup required parameters
@@ -30,19 +29,24 @@ def prepL7TOA(img):
     '''
     # Rename bands
     img = img.select(l7Bands, stdBands)
+    
+    # Scene footprint without edges (2 km buffer), taken from the input
+    # image so that it does not depend on the gap fill below
+    geom = img.geometry().buffer(-2000)
   
     # Mask out bad reflectance values (< 0 or >1)
-    toa = img.updateMask(img.gte(0).And(img.lte(1)))
-  
-    # Mask out incomplete pixels
-    toa = toa.updateMask(toa.mask().reduce(ee.Reducer.min()))
+    # and incomplete pixels (any band bad or masked) with a single mask
+    validMask = img.gte(0).And(img.lte(1))\
+                   .unmask(0)\
+                   .reduce(ee.Reducer.min())
+    toa = img.updateMask(validMask)
   
     # Fill L7 SLC off gaps using focal mean
     toa = ee.Image(toa.focalMean(2, 'circle', 'pixels', 8)).blend(toa)
 
     # Return clipped and masked, set product property
     return img.addBands(toa, stdBands, True)\
-              .clip(toa.geometry().buffer(-2000))\
+              .clip(geom)\
               .set('product', 'l7toa')
 
 # ---------------------------------------------------------------------------- #
@@ -57,10 +61,11 @@ def prepL8TOA(img):
     img = img.select(l8Bands, stdBands);
   
     # Mask out bad reflectance values (< 0 or >1)
-    toa = img.updateMask(img.gte(0).And(img.lte(1)))
-  
-    # Mask out incomplete pixels
-    toa = toa.updateMask(toa.mask().reduce(ee.Reducer.min()))
+    # and incomplete pixels (any band bad or masked) with a single mask
+    validMask = img.gte(0).And(img.lte(1))\
+                   .unmask(0)\
+                   .reduce(ee.Reducer.min())
+    toa = img.updateMask(validMask)
   
     # Return, copy properties, set product property
     return img.addBands(toa, stdBands, True)\
@@ -78,10 +83,11 @@ def prepS2TOA(img):
     img = img.select(s2Bands, stdBands)
   
     # Mask out bad reflectance values (< 0 or >10000)
-    toa = img.updateMask(img.gte(0).And(img.lte(10000)))
-  
-    # Mask out incomplete pixels
-    toa = toa.updateMask(toa.mask().reduce(ee.Reducer.min()))
+    # and incomplete pixels (any band bad or masked) with a single mask
+    validMask = img.gte(0).And(img.lte(10000))\
+                   .unmask(0)\
+                   .reduce(ee.Reducer.min())
+    toa = img.updateMask(validMask)
   
     # Scale to range 0 - 1
     toa = toa.unitScale(0, 10000)
@@ -99,8 +105,9 @@ def addNDSI(img):
     as a band to optical images with standard band names (green and swir1).
     The values are scaled to [0, 1] range for use in classifiers.   
     """
-    # Compute NDSI, scale to [0-1] range for classifiers
+    # Compute NDSI, scale from [-1, 1] to [0-1] range for classifiers
     ndsi = img.normalizedDifference(['green','swir1'])\
-              .unitScale(-1, 1)\
+              .multiply(0.5)\
+              .add(0.5)\
               .rename('ndsi')
     return img.addBands(ndsi)
\ No newline at end of file
@@ -4,9 +4,8 @@
 # ice presence (1)/absence (0)
 
 # ---------------------------------------------------------------------------- #
-# Initialize EE API
+# Import EE API (initialized by caller, see initEE.py)
 import ee
-ee.Initialize()
 
 # ---------------------------------------------------------------------------- #
 # Import required packages
@@ -28,15 +27,17 @@ def breakupDate(image, iceBreakupImg):
     OUTPUT
     iceBreakupImg updated at each iteration, logs updated variables from 
     current image ('classIce', 't'), the 2 previous images at t-1 
-    ('classIce_1', 't_1') and t-2 ('classIce_2', 't_2'), and the flag 
-    indicating if an ice-water-water sequence was detected ('seqDetected')   
+    ('classIce_1', 't_1') and t-2 ('classIce_2', 't_2'), the flag 
+    indicating if an ice-water-water sequence was detected ('seqDetected'),
+    and the classification of the first image with data ('firstObsIsIce',
+    2 until a first image has data)
     """
     # IF classIce band in a given pixel of 'image' HAS data
     pixelHasData = image.select('classIce').mask()  
     # AND IF the iceBreakupImg HAS NOT detected an ice-water-water sequence in that pixel
-    noBreakupDetected = ee.Image(iceBreakupImg).select('seqDetected').eq(1).Not()
+    noBreakupDetected = ee.Image(iceBreakupImg).select('seqDetected').eq(0)
     # then flag the pixel as okay to be updated
-    pixels2Update = pixelHasData.add(noBreakupDetected).eq(2) 
+    pixels2Update = pixelHasData.And(noBreakupDetected)
 
     # update mask over all bands in current image
     currentImg = image.select(['classIce', 't']).updateMask(pixels2Update)
@@ -66,23 +67,93 @@ def breakupDate(image, iceBreakupImg):
     cond2 = updatedIceLag1.select('classIce_1').eq(0) # water at t_1
     cond3 = updatedIceLag2.select('classIce_2').eq(1) # ice at t_2
     # is each condition in sequence met ?
-    seqDetected = cond1.add(cond2).add(cond3).eq(3)\
+    seqDetected = cond1.And(cond2).And(cond3)\
                        .toUint16()\
                        .rename(['seqDetected'])
 
+    # FIRST OBSERVATION ----------------------------------------- #
+    # where the pixel has its first data, log its classification
+    firstObs = ee.Image(iceBreakupImg).select('firstObsIsIce')
+    updatedFirstObs = firstObs.where(pixelHasData.And(firstObs.eq(2)),
+                                     image.select('classIce'))\
+                              .rename(['firstObsIsIce'])
+
     # reassemble updated bands to form iceBreakupImg
     updatedImg = updatedIceLag0.addBands(updatedIceLag1)\
                                .addBands(updatedIceLag2)\
-                               .addBands(seqDetected)
+                               .addBands(seqDetected)\
+                               .addBands(updatedFirstObs)
 
     # return iceBreakupImg with updated pixels
     return ee.Image(iceBreakupImg).addBands(updatedImg,
                                             [ 't', 'classIce',
                                             't_1', 'classIce_1',
                                             't_2', 'classIce_2',
-                                            'seqDetected'],
+                                            'seqDetected', 'firstObsIsIce'],
                                             True) # overwrite
 
+# ---------------------------------------------------------------------------- #
+# Spring breakup detection function on arrays
+# Vectorized equivalent of iterating breakupDate() through a time series: all
+# observations of a pixel are laid out in an array and the first ice-water-water
+# sequence is located in a single step
+def breakupDateArray(imgCol, startDoy):
+    """
+    This function finds, for each pixel, the first ice-water-water sequence
+    in a time series, as flagged by iterating breakupDate() through it
+    INPUTS
+    imgCol: image collection of ice-water classifications sorted in 
+            chronological order, requires bands 'classIce' (ice(1)/water(0)
+            classification) and 't' (time as doy)
+    startDoy: day of year at which the time series starts, the series is
+              preceded by two ice observations at that time (as in the
+              initial state of breakupDate())
+    OUTPUT
+    image with the time of the last ice observation ('t_2') and of the first
+    water observation ('t_1') of the sequence, the flag indicating if a
+    sequence was detected ('seqDetected'), and the flag indicating if the
+    first observation of the time series is ice ('firstObsIsIce')
+    """
+    # Array [n, 2] of ('classIce', 't') of each pixel, observations where
+    # the pixel is masked are dropped
+    obs = imgCol.select(['classIce', 't']).toArray().toInt32()
+    # Two ice observations at startDoy before the time series, and a
+    # sentinel observation (neither ice nor water) after it, so that the
+    # arrays below are never empty
+    before = ee.Image(ee.Array([[1, startDoy], [1, startDoy]])).toInt32()
+    after = ee.Image(ee.Array([[2, 0]])).toInt32()
+    series = before.arrayCat(obs, 0).arrayCat(after, 0)
+    
+    # Split into 1D arrays of 'classIce' and 't'
+    ice = series.arraySlice(1, 0, 1).arrayProject([0])
+    t = series.arraySlice(1, 1, 2).arrayProject([0])
+    
+    # Is each condition in sequence met at every position of the series ?
+    cond1 = ice.arraySlice(0, 2).eq(0) # water at t0
+    cond2 = ice.arraySlice(0, 1, -1).eq(0) # water at t_1
+    cond3 = ice.arraySlice(0, 0, -2).eq(1) # ice at t_2
+    seq = cond1.And(cond2).And(cond3)
+    
+    # Position (of t_2) of the first sequence, and if there is one
+    pos = seq.arrayArgmax().arrayFlatten([['pos']])
+    seqDetected = seq.arrayReduce(ee.Reducer.max(), [0])\
+                     .arrayFlatten([['seqDetected']])\
+                     .toUint16()
+    
+    # First observation after the two initial ice observations
+    firstObsIsIce = ice.arraySlice(0, 2, 3)\
+                       .arrayFlatten([['firstObsIsIce']])\
+                       .eq(1)\
+                       .rename(['firstObsIsIce'])
+    
+    # Times of the sequence
+    t_2 = t.arrayGet(pos).toUint16().rename(['t_2'])
+    t_1 = t.arrayGet(pos.add(1)).toUint16().rename(['t_1'])
+    
+    return t_1.addBands(t_2)\
+              .addBands(seqDetected)\
+              .addBands(firstObsIsIce)
+
 # ---------------------------------------------------------------------------- #
 # Function to prep image collection for change detection
 
@@ -99,23 +170,39 @@ def prep4ChangeDetection(img):
 
 # ---------------------------------------------------------------------------- #
 # Function to prep image collection for change detection
-def detectSpringBreakup(imgCol, poiStart, tile):
+def detectSpringBreakup(imgCol, poiStart, tile, useArrays = True):
     """
     imgCol: image collection with ice-water classifications
     poiStart: date (datetime object 'YYYY-MM-DD') at which to start 
     tile: region of interest (ee.Geometry)
+    useArrays: logical, detect sequences on arrays of each pixel's time series
+               with breakupDateArray() (default is True), otherwise iterate
+               through imgCol with breakupDate(), slower but holds a single
+               image at a time in memory
+    OUTPUT
+    iceBreakupImg with bands 't_1', 't_2', and 'seqDetected' (see breakupDate()),
+    masked where the first observation is water
     """
     # Setup Image Collection for iterated function            
     imgCol = imgCol.map(prep4ChangeDetection).sort('system:time_start')
 
     # Setup the initial all ice image 'iceBreakupImg', start at poiStart
     date = poiStart.getRelative('day', 'year').add(1)
+    
+    # Detect sequences on arrays
+    if useArrays:
+        iceBreakupImg = breakupDateArray(imgCol, date).clip(tile)
+        # First observation after poiStart needs to be ice, if it is water mask it out
+        return iceBreakupImg.updateMask(iceBreakupImg.select('firstObsIsIce'))
+    
     firstImgDate = ee.Image(date).toUint16().rename(['t'])
     firstImgSeqDetect = ee.Image(0).toUint16().rename(['seqDetected'])                           
+    firstImgFirstObs = ee.Image(2).toUint16().rename(['firstObsIsIce'])
     allIceImg = ee.Image(1).toUint16().rename(['classIce']).addBands(firstImgDate)
     iceBreakupImg = allIceImg.addBands(allIceImg)\
                              .addBands(allIceImg)\
                              .addBands(firstImgSeqDetect)\
+                             .addBands(firstImgFirstObs)\
                              .clip(tile)
     
     # Iterate through imgCol, update iceBreakupImg using breakupDate()
@@ -123,9 +210,8 @@ def detectSpringBreakup(imgCol, poiStart, tile):
     iceBreakupImg = ee.Image(imgCol.iterate(breakupDate, iceBreakupImg))
     
     # First observation after poiStart needs to be ice, if it is water mask it out
-    firstObsIsIce = imgCol.select(['classIce'])\
-                          .reduce(ee.Reducer.firstNonNull())\
-                          .eq(1)
+    # (logged during the iteration, no need for another pass over imgCol)
+    firstObsIsIce = iceBreakupImg.select('firstObsIsIce').eq(1)
     iceBreakupImg = iceBreakupImg.updateMask(firstObsIsIce)
     
     # Return iceBreakupImg